@@ -1,11 +1,16 @@
 import os
-import uuid
+import secrets
 import logging
 import re
+import shutil
+from itertools import chain, islice
 from flask import render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory
 # Import TimeoutError for exception handling
 from socket import timeout as TimeoutError
 from werkzeug.utils import secure_filename
+from sqlalchemy import delete, insert
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
 import json
 from datetime import datetime
 from pdf_reader import process_pdf
@@ -15,18 +20,119 @@ from as400_parser import parse_as400_audit
 
 
 # Import from main.py where app is created
-from main import app, db
+from main import app, db, cache, task_queue
 from models import ReportItem, ExportFile
-from data_exporter import export_to_excel
+from data_exporter import EXPORT_DIR, export_to_excel, export_to_google_sheets
 
 
 # Configure upload folder
 UPLOAD_FOLDER = '/tmp/uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+# Cap in-memory non-file form fields at 64KB, well under Flask's 500KB
+# default; the only form fields here are short strings (export_type,
+# item_number, description). File parts are already spooled to a temp file
+# by werkzeug past 500KB and copied from there by save_upload.
+app.config['MAX_FORM_MEMORY_SIZE'] = 64 * 1024
+
+# Rows per INSERT statement when saving extracted items; keeps each batch's
+# parameters and memory bounded for very large logs
+app.config.setdefault('INSERT_BATCH_SIZE', 1000)
+
+# Extensions accepted by the log upload, including the dot as returned by splitext
+LOG_EXTENSIONS = frozenset({'.txt', '.pdf'})
+
+
+def insert_report_items(rows):
+    """Insert ReportItem rows (dicts of column values) in INSERT_BATCH_SIZE chunks.
+
+    Accepts any iterable so parsed logs can be streamed straight into the
+    table; returns the number of rows inserted.
+    """
+    batch_size = app.config['INSERT_BATCH_SIZE']
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        db.session.execute(insert(ReportItem), batch)
+        count += len(batch)
+
+def ingest_log_file(filepath, ext, session_id):
+    """Parse a saved .txt/.pdf log and store its rows under session_id.
+
+    Returns the number of rows saved. Runs inline for the upload request or
+    inside an RQ worker via run_log_upload_job. The saved upload is deleted
+    once it has been processed, whether or not that succeeded.
+    """
+    try:
+        # Decide how to process
+        if ext == ".txt":
+            # Try AS400-style parser
+            entries = parse_as400_audit(filepath)
+            first = next(entries, None)
+
+            # Fallback to tab-delimited if AS400 returns nothing
+            if first is None:
+                extracted_data = process_direct(filepath)
+            else:
+                extracted_data = chain([first], entries)
+        else:
+            extracted_data = process_pdf(filepath)
+
+        # Anything but the old dict format is a stream of AS400-style entries
+        if not isinstance(extracted_data, dict):
+            mappings = ({
+                "session_id": session_id,
+                "item_number": entry.get("Item#", ""),
+                "department": entry.get("Dept", ""),
+                "price": entry.get("Tender $", ""),
+                "period": entry.get("Period", "P00"),
+                "exception": "",
+                "quantity": entry.get("Qty", "1"),
+                "additional_info": entry.get("Auditor", ""),
+                "original_description": entry.get("Tracking#", ""),
+                "original_date": entry.get("Date", ""),
+                "original_time": ""
+            } for entry in extracted_data)
+        else:
+            # Old format (dict of key:value pairs)
+            mappings = [{
+                "session_id": session_id,
+                "item_number": key,
+                "department": "",
+                "price": value,
+                "period": "P00",
+                "exception": "",
+                "quantity": 1,
+                "additional_info": "Imported via log upload",
+                "original_description": key,
+                "original_date": "",
+                "original_time": ""
+            } for key, value in extracted_data.items()]
+
+        # Batched multi-row INSERTs instead of building a ReportItem per row,
+        # committed as a single transaction
+        try:
+            item_count = insert_report_items(mappings)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
+        return item_count
+    finally:
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+
+def run_log_upload_job(filepath, ext, session_id):
+    """RQ entry point for a queued log upload."""
+    with app.app_context():
+        return {"item_count": ingest_log_file(filepath, ext, session_id)}
 
 @app.route('/upload-log', methods=['POST'])
 def upload_log_file():
@@ -40,82 +146,101 @@ def upload_log_file():
     if not filename:
         return jsonify({"success": False, "message": "Empty filename"})
 
-    session_id = str(uuid.uuid4())
-    session['session_id'] = session_id
-
-    # Save file temporarily
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
-
-
-# Decide how to process
-    if ext == ".txt":
-    # Try AS400-style parser
-        extracted_data = parse_as400_audit(filepath)
-
-    # Fallback to tab-delimited if AS400 returns nothing
-        if not extracted_data:
-            extracted_data = process_direct(filepath)
-
-    elif ext == ".pdf":
-        extracted_data = process_pdf(filepath)
-  
-    else:
+    # Reject unsupported types before anything is written to disk
+    if ext not in LOG_EXTENSIONS:
         return jsonify({"success": False, "message": "Unsupported file type"})
 
+    session_id = secrets.token_urlsafe(16)
+
+    # Save file temporarily under a per-upload name, so two uploads of the
+    # same filename can't overwrite each other before a worker reads them
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}_{secure_filename(filename)}")
+    save_upload(file, filepath)
+
+    # With a task queue configured, parsing happens in a worker and the
+    # browser polls /task/<id> instead of holding this request open
+    if task_queue is not None:
+        job = task_queue.enqueue(run_log_upload_job, filepath, ext, session_id, job_timeout=600)
+        session['session_id'] = session_id
+        return jsonify({
+            "success": True,
+            "message": "Log queued for processing",
+            "task_id": job.id,
+            "status_url": url_for('task_status', task_id=job.id)
+        })
 
+    try:
+        ingest_log_file(filepath, ext, session_id)
+    except Exception as e:
+        logging.error(f"Error saving log upload: {str(e)}")
+        return jsonify({"success": False, "message": f"Error: {str(e)}"})
 
-# Check if data is a list (AS400-style)
-    if isinstance(extracted_data, list):
-        for entry in extracted_data:
-            report_item = ReportItem(
-                session_id=session_id,
-                item_number=entry.get("Item#", ""),
-                department=entry.get("Dept", ""),
-                price=entry.get("Tender $", ""),
-                period="P00",
-                exception="",
-                quantity=entry.get("Qty", "1"),
-                additional_info=entry.get("Auditor", ""),
-                original_description=entry.get("Tracking#", ""),
-                original_date=entry.get("Date", ""),
-                original_time=""
-            )
-            db.session.add(report_item)
-    else:
-    # Old format (dict of key:value pairs)
-        for key, value in extracted_data.items():
-            report_item = ReportItem(
-                session_id=session_id,
-                item_number=key,
-                department="",
-                price=value,
-                period="P00",
-                exception="",
-                quantity=1,
-                additional_info="Imported via log upload",
-                original_description=key,
-                original_date="",
-                original_time=""
-            )
-            db.session.add(report_item)
-
-    db.session.commit()
-    # Store in session for export
-    # Store in session for export/preview
-    session['extracted_data'] = extracted_data
+    # Only the session ID goes in the session; the rows live in the database
+    session['session_id'] = session_id
     return jsonify({"success": True, "message": "Log uploaded successfully"})
 
+@app.route('/task/<task_id>')
+def task_status(task_id):
+    if task_queue is None:
+        return jsonify({"success": False, "message": "Background processing is not enabled"}), 404
+
+    try:
+        job = Job.fetch(task_id, connection=task_queue.connection)
+    except NoSuchJobError:
+        return jsonify({"success": False, "message": "Task not found"}), 404
+
+    status = job.get_status()
+    if job.is_finished:
+        result = job.return_value() or {}
+        if result.get("export_filename"):
+            return jsonify({"success": True, "status": status,
+                            "download_url": url_for('download_file', filename=result["export_filename"])})
+        return jsonify({"success": True, "status": status, "redirect_url": url_for('show_results')})
+    if job.is_failed:
+        return jsonify({"success": False, "status": status, "message": "Processing failed"})
+    return jsonify({"success": True, "status": status})
+
+# Copy uploads in 1MB chunks instead of werkzeug's default 16KB
+UPLOAD_COPY_BUFSIZE = 1 << 20
+
+def save_upload(file, filepath):
+    with open(filepath, 'wb') as dst:
+        shutil.copyfileobj(file.stream, dst, length=UPLOAD_COPY_BUFSIZE)
+
 # Allowed file extensions
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'})
+_ALLOWED_EXT_RE = re.compile(r'\.(?:%s)$' % '|'.join(sorted(ALLOWED_EXTENSIONS)), re.IGNORECASE)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return _ALLOWED_EXT_RE.search(filename) is not None
+
+def get_session_items(session_id):
+    """Load the saved rows for an upload session in the shape the results page and exporters expect."""
+    if not session_id:
+        return []
+    items = ReportItem.query.filter_by(session_id=session_id).order_by(ReportItem.id).all()
+    return [{
+        'item_number': item.item_number,
+        'department': item.department or '',
+        'price': item.price or '',
+        'period': item.period or 'P00',
+        'exception': item.exception or '',
+        'quantity': item.quantity,
+        'description': item.original_description or '',
+        'date': item.original_date or '',
+        'time': item.original_time or '',
+    } for item in items]
+
+@cache.cached(timeout=30, key_prefix='recent_exports')
+def get_recent_exports():
+    # Cached as plain dicts so no ORM instances outlive their session
+    exports = ExportFile.query.order_by(ExportFile.created_at.desc()).limit(5).all()
+    return [export.to_dict() for export in exports]
 
 @app.route('/')
 def index():
     # Get the 5 most recent exports to show in the UI
-    recent_exports = ExportFile.query.order_by(ExportFile.created_at.desc()).limit(5).all()
+    recent_exports = get_recent_exports()
     return render_template('index.html', recent_exports=recent_exports)
 
 @app.route('/upload', methods=['POST'])
@@ -140,8 +265,7 @@ def upload_file():
             from safe_uploader import process_receipt_image_safe
             
             # Generate a session ID for this batch of data
-            session_id = str(uuid.uuid4())
-            session['session_id'] = session_id
+            session_id = secrets.token_urlsafe(16)
             
             # Process the image using our safe processor
             success, result = process_receipt_image_safe(
@@ -165,28 +289,26 @@ def upload_file():
                 flash('No item numbers detected from the receipt. Try a clearer image or different lighting.', 'warning')
                 return redirect(url_for('index'))
             
-            # Save extracted items to database
-            for item in extracted_data:
-                report_item = ReportItem(
-                    session_id=session_id,
-                    item_number=item.get('item_number', ''),
-                    price=item.get('price', ''),
-                    period=item.get('period', 'P04'),  # Default to April if not specified
-                    exception=item.get('exception', ''),
-                    quantity=item.get('quantity', 1),
-                    additional_info=item.get('time', ''),  # Use time as additional info
-                    original_description=item.get('description', ''),
-                    original_date=item.get('date', ''),
-                    original_time=item.get('time', '')
-                )
-                db.session.add(report_item)
+            # Save extracted items to database with batched bulk INSERTs
+            insert_report_items([{
+                'session_id': session_id,
+                'item_number': item.get('item_number', ''),
+                'price': item.get('price', ''),
+                'period': item.get('period', 'P04'),  # Default to April if not specified
+                'exception': item.get('exception', ''),
+                'quantity': item.get('quantity', 1),
+                'additional_info': item.get('time', ''),  # Use time as additional info
+                'original_description': item.get('description', ''),
+                'original_date': item.get('date', ''),
+                'original_time': item.get('time', '')
+            } for item in extracted_data])
             
             # Commit to database
             db.session.commit()
             logging.info(f"Saved {len(extracted_data)} items to database with session ID: {session_id}")
             
-            # Store extracted data in session for later use
-            session['extracted_data'] = extracted_data
+            # Store session ID for later use; the rows live in the database
+            session['session_id'] = session_id
             
             # Success message
             flash(f'Receipt processed successfully. {len(extracted_data)} items extracted.', 'success')
@@ -215,13 +337,12 @@ def upload_file():
 
 @app.route('/results')
 def show_results():
-    extracted_data = session.get('extracted_data', [])
+    extracted_data = get_session_items(session.get('session_id'))
     if not extracted_data:
         flash('No data has been extracted yet.', 'warning')
         return redirect(url_for('index'))
     
     # Pass current datetime for template to use
-    from datetime import datetime
     now = datetime.now()
     
     return render_template('results.html', data=extracted_data, now=now)
@@ -230,32 +351,30 @@ def show_results():
 def update_data():
     try:
         updated_data = request.json
-        session['extracted_data'] = updated_data
         
         # Get session ID
         session_id = session.get('session_id')
         if not session_id:
             return jsonify({"success": False, "message": "Session ID not found. Please upload an image first."})
         
-        # Delete previous items for this session
-        ReportItem.query.filter_by(session_id=session_id).delete()
+        rows = [{
+            'session_id': session_id,
+            'item_number': item.get('item_number', ''),
+            'price': item.get('price', ''),
+            'period': item.get('period', 'P00'),
+            'exception': item.get('exception', ''),
+            'quantity': item.get('quantity', 1),
+            'additional_info': item.get('time', ''),  # Store additional info from the time field
+            # Store original values for reference
+            'original_description': item.get('description', ''),
+            'original_date': item.get('date', ''),
+            'original_time': item.get('time', '')
+        } for item in updated_data]
         
-        # Add updated items to database
-        for item in updated_data:
-            report_item = ReportItem(
-                session_id=session_id,
-                item_number=item.get('item_number', ''),
-                price=item.get('price', ''),
-                period=item.get('period', 'P00'),
-                exception=item.get('exception', ''),
-                quantity=item.get('quantity', 1),
-                additional_info=item.get('time', ''),  # Store additional info from the time field
-                # Store original values for reference
-                original_description=item.get('description', ''),
-                original_date=item.get('date', ''),
-                original_time=item.get('time', '')
-            )
-            db.session.add(report_item)
+        # Replace the session's items in one transaction: a single Core DELETE
+        # followed by batched executemany INSERTs
+        db.session.execute(delete(ReportItem).where(ReportItem.session_id == session_id))
+        insert_report_items(rows)
         
         db.session.commit()
         return jsonify({"success": True, "message": "Data updated successfully"})
@@ -264,30 +383,49 @@ def update_data():
         logging.error(f"Error updating data: {str(e)}")
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
 
+def run_excel_export_job(data, session_id):
+    """RQ entry point: build the Excel file and record it as an ExportFile.
+
+    The row is only created once the workbook exists, so a failed or
+    never-run job leaves nothing behind in the export history.
+    """
+    with app.app_context():
+        download_path = export_to_excel(data)
+        download_name = os.path.basename(download_path)
+        db.session.add(ExportFile(
+            session_id=session_id,
+            export_type='excel',
+            item_count=len(data),
+            filename=download_name,
+            file_path=download_path
+        ))
+        db.session.commit()
+        cache.delete('recent_exports')
+        return {"export_filename": download_name}
+
+def normalize_export_row(row):
+    """Map a row in AS400 or standard format onto the keys the exporters read."""
+    if not isinstance(row, dict):
+        return row
+    return {
+        "item_number": row.get("Item#", row.get("item_number", "")),
+        "price": row.get("Tender $", row.get("price", "")),
+        "department": row.get("Dept", row.get("department", "")),
+        "quantity": row.get("Qty", row.get("quantity", "1")),
+        "period": row.get("Period", row.get("period", "P00")),
+        "exception": row.get("Exceptions", row.get("exception", "")),
+        "description": row.get("Tracking#", row.get("description", "")),
+        "date": row.get("Date", row.get("date", "")),
+        "time": row.get("Time", row.get("time", "")),
+    }
+
 @app.route('/export', methods=['POST'])
 def export_data():
     export_type = request.form.get('export_type', 'excel')
-    data = session.get('extracted_data', [])
-    # Normalize keys for export (handles AS400 and standard format)
-    normalized_data = []
-    for row in data:
-        if isinstance(row, dict):
-            normalized_data.append({
-            "item_number": row.get("Item#", row.get("item_number", "")),
-            "price": row.get("Tender $", row.get("price", "")),
-            "department": row.get("Dept", row.get("department", "")),
-            "quantity": row.get("Qty", "1"),
-            "period": row.get("Period", "P00"),
-            "exception": row.get("Exceptions", row.get("exception", "")),
-            "description": row.get("Tracking#", row.get("description", "")),
-            "date": row.get("Date", row.get("date", "")),
-            "time": row.get("Time", row.get("time", "")),
-        })
-    else:
-            normalized_data.append(row)
-
     session_id = session.get('session_id')
-    
+    data = get_session_items(session_id)
+    normalized_data = [normalize_export_row(row) for row in data]
+
     if not data:
         flash('No data to export.', 'warning')
         return redirect(url_for('show_results'))
@@ -298,23 +436,37 @@ def export_data():
     
     try:
         # Create export record
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         export_file = ExportFile(
             session_id=session_id,
             export_type=export_type,
             item_count=len(data),
-            filename=f"refund_audit_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            filename=f"refund_audit_log_{timestamp}"
         )
         
-        if export_type == 'excel':
+        if export_type == 'excel' and task_queue is not None:
+            # Let a worker build the workbook; it records the ExportFile row
+            # itself once the file has been written
+            job = task_queue.enqueue(run_excel_export_job, normalized_data, session_id, job_timeout=600)
+            return jsonify({
+                "success": True,
+                "status": "pending",
+                "task_id": job.id,
+                "status_url": url_for('task_status', task_id=job.id)
+            })
+        
+        elif export_type == 'excel':
             download_path = export_to_excel(normalized_data)
+            download_name = os.path.basename(download_path)
             export_file.file_path = download_path
-            export_file.filename = os.path.basename(download_path)
+            export_file.filename = download_name
             db.session.add(export_file)
             db.session.commit()
+            cache.delete('recent_exports')
             
             flash('Data exported to Excel successfully.', 'success')
             # Return file download link
-            return jsonify({"success": True, "download_url": url_for('download_file', filename=os.path.basename(download_path))})
+            return jsonify({"success": True, "download_url": url_for('download_file', filename=download_name)})
             
         elif export_type == 'google':
             try:
@@ -322,6 +474,7 @@ def export_data():
                 export_file.sheet_url = spreadsheet_url
                 db.session.add(export_file)
                 db.session.commit()
+                cache.delete('recent_exports')
                 
                 flash('Data exported to Google Sheets successfully.', 'success')
                 return jsonify({"success": True, "spreadsheet_url": spreadsheet_url})
@@ -332,16 +485,18 @@ def export_data():
                     flash('Google Sheets export requires credentials. Exporting to Excel instead.', 'warning')
                     
                     # Fall back to Excel export
-                    download_path = export_to_excel(data)
+                    download_path = export_to_excel(normalized_data)
+                    download_name = os.path.basename(download_path)
                     export_file.export_type = 'excel'  # Update the export type
                     export_file.file_path = download_path
-                    export_file.filename = os.path.basename(download_path)
+                    export_file.filename = download_name
                     db.session.add(export_file)
                     db.session.commit()
+                    cache.delete('recent_exports')
                     
                     return jsonify({
                         "success": True, 
-                        "download_url": url_for('download_file', filename=os.path.basename(download_path)),
+                        "download_url": url_for('download_file', filename=download_name),
                         "fallback": True,
                         "fallback_message": "Exported to Excel instead of Google Sheets due to missing credentials."
                     })
@@ -361,43 +516,76 @@ def export_data():
 
 @app.route('/download/<filename>')
 def download_file(filename):
-    # Check the version of Flask to determine the correct parameters
-    try:
-        # For newer versions of Flask
-        return send_from_directory(os.path.join('/tmp', 'exports'), filename, as_attachment=True)
-    except TypeError:
-        # For older versions that expect 'directory' parameter
-        return send_from_directory(directory=os.path.join('/tmp', 'exports'), filename=filename, as_attachment=True)
+    # conditional/etag let a browser that already has the file revalidate
+    # with If-None-Match (or resume with Range) and get a 304/206 back.
+    # export_to_excel gives every export a unique filename that is never
+    # rewritten, so an hour of client caching is safe
+    return send_from_directory(EXPORT_DIR, filename, as_attachment=True,
+                               conditional=True, etag=True, max_age=3600)
+
+# Shared receipt trainer, reloaded only when its training data file changes
+_trainer = None
+_trainer_mtime = 0
+
+def _training_data_mtime(trainer):
+    path = trainer.training_data_path
+    return os.path.getmtime(path) if os.path.exists(path) else 0
+
+def get_trainer():
+    global _trainer, _trainer_mtime
+    if _trainer is None or _training_data_mtime(_trainer) != _trainer_mtime:
+        _trainer = ReceiptTrainer()
+        _trainer_mtime = _training_data_mtime(_trainer)
+    return _trainer
+
+def invalidate_trainer():
+    global _trainer_mtime
+    _trainer_mtime = 0
+
+def make_image_exists_check(uploads_folder):
+    """Return an existence check for example images that uses one listing of
+    uploads_folder instead of a stat() per image."""
+    existing = set(os.listdir(uploads_folder))
+    uploads_dir = os.path.normpath(uploads_folder)
+
+    def image_exists(image_path):
+        if not image_path:
+            return False
+        if os.path.normpath(os.path.dirname(image_path)) == uploads_dir:
+            return os.path.basename(image_path) in existing
+        # Images stored elsewhere still get a direct check
+        return os.path.exists(image_path)
+
+    return image_exists
+
+def build_training_examples(trainer, uploads_folder):
+    """Summarize the trainer's examples for display in train.html."""
+    if not os.path.exists(trainer.training_data_path):
+        return []
+    image_exists = make_image_exists_check(uploads_folder)
+    basename = os.path.basename
+    examples = []
+    for example in trainer.training_data.get('examples', []):
+        get = example.get
+        image_path = get('image_path', '')
+        examples.append({
+            'item_number': get('item_number', ''),
+            'description': get('description', ''),
+            'added_at': get('added_at', ''),
+            'image_path': image_path,
+            'image_filename': basename(image_path) if image_path else '',
+            'image_exists': image_exists(image_path)
+        })
+    return examples
 
 @app.route('/train', methods=['GET', 'POST'])
 def train():
     # Setup static folder for upload images if it doesn't exist
     uploads_folder = os.path.join('static', 'uploads')
-    if not os.path.exists(uploads_folder):
-        os.makedirs(uploads_folder)
+    os.makedirs(uploads_folder, exist_ok=True)
         
-    # Initialize trainer
-    trainer = ReceiptTrainer()
-    training_summary = trainer.get_training_summary()
-    
-    # Load existing examples for display
-    if os.path.exists(trainer.training_data_path):
-        training_examples = []
-        for example in trainer.training_data.get('examples', []):
-            image_path = example.get('image_path', '')
-            image_filename = os.path.basename(image_path) if image_path else ''
-            image_exists = os.path.exists(image_path) if image_path else False
-            
-            training_examples.append({
-                'item_number': example.get('item_number', ''),
-                'description': example.get('description', ''),
-                'added_at': example.get('added_at', ''),
-                'image_path': image_path,
-                'image_filename': image_filename,
-                'image_exists': image_exists
-            })
-    else:
-        training_examples = []
+    # Get the shared trainer (skips re-parsing the training data on repeat views)
+    trainer = get_trainer()
     
     # Handle POST request (training submission)
     if request.method == 'POST':
@@ -425,7 +613,7 @@ def train():
                 timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
                 filename = f"{timestamp}_{filename}"
                 file_path = os.path.join(uploads_folder, filename)
-                file.save(file_path)
+                save_upload(file, file_path)
                 
                 # Add to training data
                 if analyze_regions:
@@ -444,24 +632,14 @@ def train():
                     }
                     flash('Training data added successfully', 'success')
                 
+                # Training data changed on disk; reload the trainer on next use
+                invalidate_trainer()
+                
                 # Update training summary
                 training_summary = trainer.get_training_summary()
                 
-                # Force refresh of training examples
-                training_examples = []
-                for example in trainer.training_data.get('examples', []):
-                    image_path = example.get('image_path', '')
-                    image_filename = os.path.basename(image_path) if image_path else ''
-                    image_exists = os.path.exists(image_path) if image_path else False
-                    
-                    training_examples.append({
-                        'item_number': example.get('item_number', ''),
-                        'description': example.get('description', ''),
-                        'added_at': example.get('added_at', ''),
-                        'image_path': image_path,
-                        'image_filename': image_filename,
-                        'image_exists': image_exists
-                    })
+                # Build the examples list once, including the new submission
+                training_examples = build_training_examples(trainer, uploads_folder)
                 
                 # Return with results
                 return render_template('train.html', 
@@ -481,8 +659,8 @@ def train():
     
     # GET request - show training form
     return render_template('train.html', 
-                         training_summary=training_summary,
-                         training_examples=training_examples)
+                         training_summary=trainer.get_training_summary(),
+                         training_examples=build_training_examples(trainer, uploads_folder))
 
 @app.route('/history')
 def export_history():
@@ -500,4 +678,5 @@ def internal_server_error(e):
     return render_template('500.html'), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Debugger/reloader only when explicitly asked for; production runs under gunicorn
+    app.run(host='0.0.0.0', port=5000, debug=bool(os.environ.get('FLASK_DEV')), threaded=True)
@@ -1,17 +1,60 @@
 import logging
+import struct
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
+# Fixed-width column layout of an AS400 audit line: (field name, start, end).
+# The last column runs to the end of the line.
+COLUMNS = (
+    ("Rec#", 0, 4),
+    ("Trn#", 5, 9),
+    ("Date", 10, 18),
+    ("Tracking#", 19, 32),
+    ("Member#", 33, 47),
+    ("Item#", 48, 59),
+    ("Dept", 59, 63),
+    ("Qty", 64, 66),
+    ("Tender $", 67, 75),
+    ("Saleable", 76, 77),
+    ("Refund", 78, 79),
+    ("Auditor", 80, None),
+)
+
+_FIELD_NAMES = tuple(name for name, _, _ in COLUMNS)
+_FIELD_SLICES = tuple(slice(start, end) for _, start, end in COLUMNS)
+
+
+def _build_record_struct(columns):
+    """Build a struct unpacker for the fixed-width columns, skipping the gaps."""
+    fmt, pos = [], 0
+    for _, start, end in columns:
+        if start > pos:
+            fmt.append(f"{start - pos}x")
+        fmt.append(f"{end - start}s")
+        pos = end
+    return struct.Struct("".join(fmt))
+
+
+# Every column but the open-ended last one is unpacked in a single call
+_RECORD = _build_record_struct(COLUMNS[:-1])
+_TAIL_START = COLUMNS[-1][1]
+
 
 def parse_as400_audit(file_path):
     """
-    Parses fixed-width AS400 audit logs into structured dictionaries.
+    Parses fixed-width AS400 audit logs, yielding one structured dictionary
+    per data line so large logs can be streamed.
     Emits debug output on the first valid line to help verify column positions.
     """
-    data = []
-    with open(file_path, "r") as file:
+    with open(file_path, "rb") as file:
         for i, line in enumerate(file):
+            # Column offsets are character positions. They only equal byte
+            # offsets for ASCII, so other lines are decoded and sliced as text
+            is_ascii = line.isascii()
+            if not is_ascii:
+                line = line.decode("utf-8", "replace")
+
             # Skip very short or header lines
             if len(line.strip()) < 70:
                 continue
@@ -22,31 +65,22 @@ def parse_as400_audit(file_path):
                 marker = "".join(str(j % 10) for j in range(len(line)))
                 logger.debug(f" idx: {marker}")
 
-            # Extract date and determine period (e.g., "P04")
-            date_str = line[10:18].strip()
-            period = f"P{date_str[:2].zfill(2)}" if date_str[:2].isdigit() else "P00"
-
-            entry = {
-                "Rec#": line[0:4].strip(),
-                "Trn#": line[5:9].strip(),
-                "Date": date_str,
-                "Tracking#": line[19:32].strip(),
-                "Member#": line[33:47].strip(),
-                "Item#": line[48:59].strip(),
-                "Dept": line[59:63].strip(),
-                "Qty": line[64:66].strip(),
-                "Tender $": line[67:75].strip(),
-                "Saleable": line[76:77].strip(),
-                "Refund": line[78:79].strip(),
-                "Auditor": line[80:].strip(),
-                "Period": period
-            }
+            if is_ascii:
+                # Pad lines that stop before the last fixed column
+                fields = _RECORD.unpack_from(line.ljust(_RECORD.size))
+                fields += (line[_TAIL_START:],)
+                values = [f.strip().decode("ascii") for f in fields]
+            else:
+                values = [line[s].strip() for s in _FIELD_SLICES]
+            entry = dict(zip(_FIELD_NAMES, values))
+
+            # Determine period from the date (e.g., "P04")
+            date_str = entry["Date"]
+            entry["Period"] = f"P{date_str[:2].zfill(2)}" if date_str[:2].isdigit() else "P00"
 
             # Debug output for field alignment
             if i == 0:
                 logger.debug(f"parsed Item# → '{entry['Item#']}'")
                 logger.debug(f"parsed Dept   → '{entry['Dept']}'")
 
-            data.append(entry)
-
-    return data
+            yield entry
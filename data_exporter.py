@@ -1,145 +1,151 @@
 import os
-import openpyxl
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import json
+import re
+import xlsxwriter
+import orjson
 import logging
+import functools
 import uuid
 from datetime import datetime
 
+# Excel exports are written here; created once at import rather than per export
+EXPORT_DIR = os.path.join('/tmp', 'exports')
+os.makedirs(EXPORT_DIR, exist_ok=True)
+EXPORT_BUFSIZE = 1 << 20
+
+# Shared Excel format definitions; each workbook turns them into Format
+# objects once with add_format
+TITLE_FORMAT = {'bold': True, 'font_size': 14, 'align': 'center'}
+HEADER_FORMAT = {'bold': True, 'bg_color': '#D3D3D3', 'align': 'center'}
+BOLD_FORMAT = {'bold': True}
+MONEY_FORMAT = {'num_format': '$#,##0.00'}
+COUNT_FORMAT = {'num_format': '0'}
+
+# Leading "MM/" of a date, and the period label for each month
+_PERIOD_RE = re.compile(r'^(\d{1,2})/')
+_PERIOD_CACHE = {f"{m:02d}": f"P{m:02d}" for m in range(1, 13)}
+
+# Characters dropped from prices before parsing (OCR 'Y' artefacts, thousands separators)
+_PRICE_TRANS = str.maketrans('', '', 'Y,')
+
+# Numbers with an optional leading or AS400-style trailing ("12-") minus sign
+_SIGNED_INT_RE = re.compile(r'^(-?)(\d+)(-?)$')
+_SIGNED_DECIMAL_RE = re.compile(r'^(-?)(\d+\.?\d*|\.\d+)(-?)$')
+
+
+def _parse_signed(value, pattern, cast, default):
+    """Parse value with one regex match, returning default if it is not a number."""
+    m = pattern.match(value)
+    if not m:
+        return default
+    number = cast(m.group(2))
+    return -number if m.group(1) or m.group(3) else number
+
+
+def _period_from_date(date_str):
+    """Return the "Pmm" period for a "MM/..." date, or "P00" if there is no valid month."""
+    m = _PERIOD_RE.match(date_str) if date_str else None
+    return _PERIOD_CACHE.get(m.group(1).zfill(2), "P00") if m else "P00"
+
 def export_to_excel(data):
     """Export extracted data to Excel file in REFUND AUDIT LOG format."""
     try:
-        # Create a new workbook and select the active worksheet
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "REFUND AUDIT LOG"
-        
-        # Add title
-        ws.merge_cells('A1:E1')
-        title_cell = ws['A1']
-        title_cell.value = "REFUND AUDIT LOG SUMMARY"
-        title_cell.font = openpyxl.styles.Font(bold=True, size=14)
-        title_cell.alignment = openpyxl.styles.Alignment(horizontal='center')
-        
-        # Add headers - following the format in the image
-        headers = ['Item #','Department', 'Qty', 'Total Sell', 'Period']
-        
-        # Apply header styling
-        header_row = 2
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=header_row, column=col_num)
-            cell.value = header
-            cell.font = openpyxl.styles.Font(bold=True)
-            cell.fill = openpyxl.styles.PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-            cell.alignment = openpyxl.styles.Alignment(horizontal='center')
-        
-        # Add data rows - convert our extracted data to this format
-        start_row = 3
-        for row_num, item in enumerate(data, start_row):
-            # Item number
-            ws.cell(row=row_num, column=1).value = item.get('item_number', '')
-            
-            #Department
-            ws.cell(row=row_num, column=2).value = item.get('department', '')
-            
-            # Quantity (use the quantity field if available, default to 1)
+        # Convert our extracted data to row values
+        rows = []
+        for item in data:
             # Quantity (handles AS400 '1-' format too)
             qty_raw = str(item.get('quantity', '1')).strip()
+            qty = _parse_signed(qty_raw, _SIGNED_INT_RE, int, 1)
 
-            if qty_raw.endswith('-') and qty_raw[:-1].isdigit():
-                qty = int('-' + qty_raw[:-1])
-            elif qty_raw.isdigit():
-                qty = int(qty_raw)
-            else:
-                qty = 1
+            # Total Sell (Price) - If we have quantity > 1, this should be the total amount
+            price_str = str(item.get('price', '0.00')).translate(_PRICE_TRANS).strip()
+            price_val = _parse_signed(price_str, _SIGNED_DECIMAL_RE, float, 0.00)
 
-            ws.cell(row=row_num, column=3).value = qty
+            # Period (use the period field if available, or extract from date)
+            period = item.get('period', '') or _period_from_date(item.get('date', ''))
 
-            
-            # Total Sell (Price) - If we have quantity > 1, this should be the total amount
-            price_cell = ws.cell(row=row_num, column=4)
-            price_str = str(item.get('price', '0.00')).replace('Y', '').replace(',', '').strip()
+            rows.append([item.get('item_number', ''), item.get('department', ''), qty, price_val, period])
 
-            if price_str.endswith('-') and price_str[:-1].replace('.', '', 1).isdigit():
-                price_val = -float(price_str[:-1])
-            elif price_str.replace('.', '', 1).isdigit():
-                price_val = float(price_str)
-            else:
-                price_val = 0.00
+        # Headers - following the format in the image
+        headers = ['Item #', 'Department', 'Qty', 'Total Sell', 'Period']
 
-            price_cell.value = price_val
-            price_cell.number_format = '$#,##0.00'
+        # Save the workbook under a unique name: the timestamp is only to the
+        # second, so a random suffix keeps same-second exports from sharing
+        # (and overwriting) a file and its cached download URL
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"refund_audit_log_{timestamp}_{uuid.uuid4().hex[:8]}.xlsx"
+        filepath = os.path.join(EXPORT_DIR, filename)
 
+        # Write through a large buffer so the zip writer's many small writes
+        # reach the file as a few big ones
+        with open(filepath, 'wb', buffering=EXPORT_BUFSIZE) as out:
+            # constant_memory streams each row to disk as soon as the next one
+            # starts, so rows must be written top to bottom. Cell text is never
+            # turned into formulas or links; the SUM is written explicitly.
+            wb = xlsxwriter.Workbook(out, {
+                'constant_memory': True,
+                'strings_to_formulas': False,
+                'strings_to_urls': False,
+            })
+            ws = wb.add_worksheet("REFUND AUDIT LOG")
+            title_fmt = wb.add_format(TITLE_FORMAT)
+            header_fmt = wb.add_format(HEADER_FORMAT)
+            bold_fmt = wb.add_format(BOLD_FORMAT)
+            money_fmt = wb.add_format(MONEY_FORMAT)
+            count_fmt = wb.add_format(COUNT_FORMAT)
 
-            
-            # Period (use the period field if available, or extract from date)
-            period = item.get('period', '')
-            if not period:
-                date_str = item.get('date', '')
-                period = "P00"  # Default
-                if date_str:
-                    try:
-                        # Try to extract month from date and convert to period
-                        if '/' in date_str:
-                            month = date_str.split('/')[0]
-                            if month.isdigit():
-                                period = f"P{month.zfill(2)}"
-                    except Exception:
-                        pass
-            ws.cell(row=row_num, column=5).value = period
-            
+            # Add title
+            ws.merge_range('A1:E1', "REFUND AUDIT LOG SUMMARY", title_fmt)
 
-        
-        # Add totals row if there is data
-        if len(data) > 0:
-            total_row = start_row + len(data)
-            
-            ws.cell(row=total_row, column=1).value = ""
-            ws.cell(row=total_row, column=2).value = ""
-            ws.cell(row=total_row, column=3).value = ""
-            
-            # Add "Grand Total" label
-            ws.cell(row=total_row, column=4).value = "Grand Total"
-            ws.cell(row=total_row, column=4).font = openpyxl.styles.Font(bold=True)
-            
-            # Sum the quantity columns
-            qty_sum_formula = f"=SUM(C{start_row}:C{total_row-1})"
-            ws.cell(row=total_row, column=5).value = f"=SUM(C{start_row}:C{total_row-1})"
-            ws.cell(row=total_row, column=5).number_format = '0'
+            # Apply header styling
+            ws.write_row(1, 0, headers, header_fmt)
+
+            # Add data rows, tracking the widest value per column as we go
+            col_widths = [len(header) for header in headers]
+            start_row = 3
+            for r, row in enumerate(rows, start_row - 1):
+                item_number, department, qty, price_val, period = row
+                ws.write_row(r, 0, (item_number, department, qty))
+                ws.write_number(r, 3, price_val, money_fmt)
+                ws.write(r, 4, period)
+                for i, value in enumerate(row):
+                    if value:
+                        col_widths[i] = max(col_widths[i], len(str(value)))
+
+            # Add totals row if there is data
+            if len(rows) > 0:
+                total_row = start_row + len(rows)
+
+                # Add "Grand Total" label and sum the quantity column
+                ws.write_string(total_row - 1, 3, "Grand Total", bold_fmt)
+                ws.write_formula(total_row - 1, 4, f"=SUM(C{start_row}:C{total_row-1})", count_fmt)
+
+            # Auto-adjust column widths; xlsxwriter only emits them on close,
+            # so they can be set after the rows have been streamed
+            for i, width in enumerate(col_widths):
+                ws.set_column(i, i, max(width, 10) + 2)
+
+            wb.close()
 
-        
-        # Auto-adjust column widths
-        for i, col in enumerate(ws.columns, 1):
-            max_length = 0
-            column_letter = openpyxl.utils.get_column_letter(i)
-            for cell in col:
-                if cell.value:
-                    try:
-                        max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-            adjusted_width = max(max_length, 10) + 2
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Make sure export directory exists
-        export_dir = os.path.join('/tmp', 'exports')
-        if not os.path.exists(export_dir):
-            os.makedirs(export_dir)
-        
-        # Save the workbook with a timestamp to avoid collisions
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"refund_audit_log_{timestamp}.xlsx"
-        filepath = os.path.join(export_dir, filename)
-        wb.save(filepath)
-        
         logging.info(f"Data exported to Excel file: {filepath}")
         return filepath
-    
+
     except Exception as e:
         logging.error(f"Error exporting to Excel: {str(e)}")
         raise e
 
+@functools.lru_cache(maxsize=1)
+def _get_gspread_client(credentials_json):
+    """Authorize a gspread client once per set of credentials and reuse it."""
+    # Imported here so processes that only export to Excel never load the
+    # Google client stack (requests, httplib2, crypto)
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    credentials_dict = orjson.loads(credentials_json)
+    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+    credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
+    return gspread.authorize(credentials)
+
 def export_to_google_sheets(data):
     """Export extracted data to Google Sheets in REFUND AUDIT LOG format."""
     try:
@@ -149,11 +155,7 @@ def export_to_google_sheets(data):
             logging.warning("No Google credentials found in environment variables.")
             raise ValueError("Google Sheets credentials not found. Please check your configuration.")
         
-        # Load credentials from JSON
-        credentials_dict = json.loads(credentials_json)
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
-        client = gspread.authorize(credentials)
+        client = _get_gspread_client(credentials_json)
         
         # Create a new spreadsheet
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -164,54 +166,34 @@ def export_to_google_sheets(data):
         worksheet = spreadsheet.get_worksheet(0)
         worksheet.update_title("REFUND AUDIT LOG")
         
-        # Add title in merged cells (A1:G1)
+        # Title goes in merged cells (A1:G1), headers in row 2
         worksheet.merge_cells('A1:G1')
-        worksheet.update_cell(1, 1, "REFUND AUDIT LOG SUMMARY")
+        headers = ['Item #', 'Exceptions', 'Qty', 'Total Sell', 'Period', 'Exceptions', 'Qty']
+        values = [["REFUND AUDIT LOG SUMMARY"], headers]
         
-        # Format title - need to use spreadsheet formatting features for this
         title_format = {
             "textFormat": {"bold": True, "fontSize": 14},
             "horizontalAlignment": "CENTER"
         }
-        worksheet.format('A1:G1', {"textFormat": {"bold": True, "fontSize": 14}})
-        
-        # Add headers in row 2
-        headers = ['Item #', 'Exceptions', 'Qty', 'Total Sell', 'Period', 'Exceptions', 'Qty']
-        worksheet.update('A2:G2', [headers])
-        
-        # Format header row
         header_format = {
             "backgroundColor": {"red": 0.83, "green": 0.83, "blue": 0.83},
             "textFormat": {"bold": True},
             "horizontalAlignment": "CENTER"
         }
-        worksheet.format('A2:G2', header_format)
+        formats = [
+            {"range": "A1:G1", "format": title_format},
+            {"range": "A2:G2", "format": header_format},
+        ]
         
         # Prepare data rows
         rows = []
         for item in data:
             # Extract period from date if available
-            date_str = item.get('date', '')
-            period = "P00"  # Default
-            if date_str:
-                try:
-                    if '/' in date_str:
-                        month = date_str.split('/')[0]
-                        if month.isdigit():
-                            period = f"P{month.zfill(2)}"
-                except Exception:
-                    pass
+            period = _period_from_date(item.get('date', ''))
             
             # Create row with proper format
             qty_raw = str(item.get('quantity', '1')).strip()
-
-            if qty_raw.endswith('-') and qty_raw[:-1].isdigit():
-                qty = int('-' + qty_raw[:-1])
-            elif qty_raw.isdigit():
-                qty = int(qty_raw)
-            else:
-                   qty = 1
-            
+            qty = _parse_signed(qty_raw, _SIGNED_INT_RE, int, 1)
 
             row = [
                 item.get('item_number', ''),   # Item #
@@ -223,24 +205,30 @@ def export_to_google_sheets(data):
             ]
             rows.append(row)
         
-        # Add data rows starting at row 3
+        # Data rows start at row 3
         if rows:
-            data_range = f"A3:G{2 + len(rows)}"
-            worksheet.update(data_range, rows)
+            values.extend(rows)
             
             # Format the price column (D) as currency
             price_range = f"D3:D{2 + len(rows)}"
-            worksheet.format(price_range, {"numberFormat": {"type": "CURRENCY"}})
+            formats.append({"range": price_range, "format": {"numberFormat": {"type": "CURRENCY"}}})
             
-            # Add Grand Total row
+            # Add Grand Total row; its SUM formula for quantity is written
+            # separately below
             total_row = 3 + len(rows)
-            worksheet.update_cell(total_row, 4, "Grand Total")
-            worksheet.format(f"D{total_row}", {"textFormat": {"bold": True}})
-            
-            # Add SUM formula for quantity
-            # Note: Google Sheets formulas need to be added with formulas parameter
             qty_sum_formula = f"=SUM(C3:C{total_row-1})"
+            values.append(["", "", "", "Grand Total", "", "", ""])
+            formats.append({"range": f"D{total_row}", "format": {"textFormat": {"bold": True}}})
+        
+        # Write every value in one request and every format in another instead
+        # of a round-trip per cell/range. The grid goes in RAW so item numbers
+        # keep leading zeros and text that looks like a date or starts with
+        # '=' is stored as entered; only the SUM cell is sent USER_ENTERED
+        # (update_cell) so it is evaluated as a formula.
+        worksheet.update(values=values, range_name='A1', raw=True)
+        if rows:
             worksheet.update_cell(total_row, 7, qty_sum_formula)
+        worksheet.batch_format(formats)
         
         # Make the spreadsheet publicly readable
         spreadsheet.share(None, perm_type='anyone', role='reader')
@@ -1,9 +1,44 @@
 import logging
 import os
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from flask_session import Session
+import orjson
+import redis
+from rq import Queue
+from sqlalchemy import event
+from sqlalchemy.schema import CreateIndex
 from models import db
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Route request.get_json() and jsonify() through orjson.
+
+    Output matches the default provider: non-str dict keys are allowed,
+    keys are sorted when sort_keys is set, and dates go through
+    self.default so they stay HTTP dates. orjson's output is already
+    compact, so the separators jsonify() and the session serializer pass
+    are accepted as-is; any other json.dumps argument (e.g. indent for
+    debug responses) falls back to the default provider.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("separators") == (",", ":"):
+            del kwargs["separators"]
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "refund_audit_log_secret_key")
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///auditlog.db"
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
@@ -12,16 +47,66 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Keep session payloads server-side in Redis when one is configured, so the
+# cookie only carries the session id; otherwise fall back to signed cookies
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(REDIS_URL)
+    Session(app)
+
+# Optional RQ queue for slow upload processing; needs an `rq worker` running
+# against the same Redis, so it is enabled explicitly. Jobs read uploads from
+# /tmp/uploads, write exports to /tmp/exports and use instance/auditlog.db, so
+# the worker (Procfile `worker:`) must run on the same host and filesystem as
+# the web process
+task_queue = None
+if REDIS_URL and os.environ.get("ENABLE_TASK_QUEUE"):
+    task_queue = Queue(connection=redis.from_url(REDIS_URL))
+
 print(">>> SQLAlchemy will use:", os.path.abspath("auditlog.db"))
 
 db.init_app(app)
 
+# Cache for small, rarely-changing lookups (e.g. recent exports). Shared
+# through Redis when available so an invalidation reaches every worker.
+if REDIS_URL:
+    cache = Cache(app, config={"CACHE_TYPE": "RedisCache", "CACHE_REDIS_URL": REDIS_URL})
+else:
+    cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
+
+# Per-connection SQLite settings: WAL lets readers run alongside the upload
+# writer, and synchronous=NORMAL is durable under WAL with fewer fsyncs
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
 with app.app_context():
+    if db.engine.dialect.name == "sqlite":
+        @event.listens_for(db.engine, "connect")
+        def set_sqlite_pragmas(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
     db.create_all()
+    # create_all skips tables that already exist, so add any indexes declared
+    # after an existing database was first created. IF NOT EXISTS keeps this
+    # safe when several gunicorn workers boot against the same database at once
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
 
 # Import after app setup to avoid circular imports
 from app import *
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Debugger/reloader only when explicitly asked for; production runs under gunicorn
+    app.run(host="0.0.0.0", port=5000, debug=bool(os.environ.get("FLASK_DEV")), threaded=True)
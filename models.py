@@ -1,3 +1,4 @@
+import operator
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 
@@ -25,7 +26,11 @@ class ReportItem(db.Model):
         return f'<ReportItem {self.item_number}>'
 
     def to_dict(self):
-        return {col.name: getattr(self, col.name) for col in self.__table__.columns}
+        return dict(zip(self._column_names, self._column_values(self)))
+
+# Column names and a C-level getter for to_dict, resolved once per model
+ReportItem._column_names = tuple(col.name for col in ReportItem.__table__.columns)
+ReportItem._column_values = operator.attrgetter(*ReportItem._column_names)
 
 class ExportFile(db.Model):
     __tablename__ = 'export_files'
@@ -36,11 +41,14 @@ class ExportFile(db.Model):
     export_type = db.Column(db.String(20), nullable=False)
     file_path = db.Column(db.String(500))
     sheet_url = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     item_count = db.Column(db.Integer, default=0)
 
     def __repr__(self):
         return f'<ExportFile {self.filename}>'
 
     def to_dict(self):
-        return {col.name: getattr(self, col.name) for col in self.__table__.columns}
+        return dict(zip(self._column_names, self._column_values(self)))
+
+ExportFile._column_names = tuple(col.name for col in ExportFile.__table__.columns)
+ExportFile._column_values = operator.attrgetter(*ExportFile._column_names)
@@ -1,3 +1,6 @@
+// Polls of a queued export's status (one per second) before giving up
+const MAX_EXPORT_POLLS = 120;
+
 document.addEventListener("DOMContentLoaded", function () {
   const exportExcelBtn = document.getElementById("export-excel-btn");
   if (exportExcelBtn) {
@@ -13,7 +16,25 @@ document.addEventListener("DOMContentLoaded", function () {
           body: "export_type=excel",
         });
 
-        const data = await response.json();
+        let data = await response.json();
+
+        // Excel exports may be built by a background worker; poll until ready,
+        // giving up after MAX_EXPORT_POLLS seconds
+        let polls = 0;
+        while (data.success && data.status_url && !data.download_url) {
+          if (++polls > MAX_EXPORT_POLLS) {
+            data = {
+              success: false,
+              message: "The export is still being prepared. Check Export History for it shortly.",
+            };
+            break;
+          }
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          const statusResponse = await fetch(data.status_url);
+          const status = await statusResponse.json();
+          data = { ...status, status_url: data.status_url };
+        }
+
         if (data.success) {
           if (data.download_url) {
             window.location.href = data.download_url;